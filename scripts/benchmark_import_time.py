@@ -0,0 +1,93 @@
+"""Cold-start benchmark for the CLI entry points.
+
+Runs `<entry point> --help` in a fresh interpreter several times for every console script
+of the installed package, prints the median wall time and fails if a command exceeds the
+time budget or imports one of the heavy dependencies that should only be loaded when the
+command actually runs.
+
+    python scripts/benchmark_import_time.py --repeat 10 --max-ms 250
+"""
+
+from __future__ import annotations
+
+import json
+import statistics
+import subprocess
+import sys
+import time
+from importlib.metadata import entry_points
+
+import click
+
+HEAVY_MODULES = ("aiohttp", "PIL", "requests", "tqdm")
+
+PACKAGE = "sqlitedb_map_tools"
+
+CHILD_SCRIPT = """
+import json, sys
+import {package}
+command = getattr({package}, {attribute!r})
+try:
+    command(["--help"], prog_name={entry_point!r})
+except SystemExit:
+    pass
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+sys.stderr.write(json.dumps(heavy))
+"""
+
+
+def _load_entry_points() -> dict[str, str]:
+    """Entry point name -> command attribute, read from the installed `project.scripts`."""
+    return {
+        entry_point.name: entry_point.attr
+        for entry_point in entry_points(group="console_scripts")
+        if entry_point.module == PACKAGE
+    }
+
+
+def _run_once(entry_point: str, attribute: str) -> tuple[float, list[str]]:
+    script = CHILD_SCRIPT.format(
+        package=PACKAGE, attribute=attribute, entry_point=entry_point, heavy=HEAVY_MODULES
+    )
+    begin_time = time.perf_counter()
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    elapsed = time.perf_counter() - begin_time
+    return elapsed, json.loads(result.stderr.strip().splitlines()[-1])
+
+
+@click.command()
+@click.option("--repeat", type=int, default=5, help="Runs per entry point. By default 5.")
+@click.option(
+    "--max-ms",
+    type=float,
+    default=None,
+    help="Fail if the median startup time of any entry point exceeds this budget.",
+)
+def main(repeat: int, max_ms: float | None) -> None:
+    commands = _load_entry_points()
+    if not commands:
+        raise click.ClickException(f"{PACKAGE} is not installed, run `rye sync` first")
+    failed = False
+    for entry_point, attribute in sorted(commands.items()):
+        timings: list[float] = []
+        heavy_modules: list[str] = []
+        for _ in range(repeat):
+            elapsed, heavy_modules = _run_once(entry_point, attribute)
+            timings.append(elapsed)
+        median_ms = statistics.median(timings) * 1000
+        status = "ok"
+        if heavy_modules:
+            status = f"imports {', '.join(heavy_modules)}"
+            failed = True
+        if max_ms is not None and median_ms > max_ms:
+            status = f"slower than {max_ms:.0f} ms"
+            failed = True
+        print(f"{entry_point:<20} {median_ms:8.1f} ms  {status}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
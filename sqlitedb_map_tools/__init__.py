@@ -1,8 +1,32 @@
-from .cut import cut_sqlitedb_map
-from .mbtiles2sqlitedb import convert_mbtiles_to_sqlitedb
-from .merge import merge_sqlitedb_maps
-from .nakarteme import download_nakarteme_maps
-from .raster_map import download_raster_map
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .apply import apply_sqlitedb_patch
+    from .cut import cut_sqlitedb_map
+    from .diff import diff_sqlitedb_maps
+    from .mbtiles2sqlitedb import convert_mbtiles_to_sqlitedb
+    from .merge import merge_sqlitedb_maps
+    from .nakarteme import download_nakarteme_maps
+    from .raster_map import download_raster_map
+    from .recompress import recompress_sqlitedb_map
+    from .serve import serve_sqlitedb_maps
+
+# Commands are imported on first attribute access, so that an entry point only pays
+# for the dependencies of the command it runs.
+_COMMAND_MODULES: dict[str, str] = {
+    "convert_mbtiles_to_sqlitedb": ".mbtiles2sqlitedb",
+    "download_nakarteme_maps": ".nakarteme",
+    "cut_sqlitedb_map": ".cut",
+    "merge_sqlitedb_maps": ".merge",
+    "download_raster_map": ".raster_map",
+    "diff_sqlitedb_maps": ".diff",
+    "apply_sqlitedb_patch": ".apply",
+    "serve_sqlitedb_maps": ".serve",
+    "recompress_sqlitedb_map": ".recompress",
+}
 
 __all__ = [
     "convert_mbtiles_to_sqlitedb",
@@ -10,4 +34,21 @@ __all__ = [
     "cut_sqlitedb_map",
     "merge_sqlitedb_maps",
     "download_raster_map",
+    "diff_sqlitedb_maps",
+    "apply_sqlitedb_patch",
+    "serve_sqlitedb_maps",
+    "recompress_sqlitedb_map",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _COMMAND_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    command = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = command
+    return command
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
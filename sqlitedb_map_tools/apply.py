@@ -0,0 +1,53 @@
+import sqlite3
+from pathlib import Path
+
+import click
+
+from .cli import cli
+from .utils import has_tile_hashes
+
+
+@cli.command(help="Applies a patch created by `sqlitedb-diff` to a .sqlitedb map file in place.")
+@click.argument(
+    "map_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.argument(
+    "patch_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+def apply_sqlitedb_patch(map_file: Path, patch_file: Path) -> None:
+    connection = sqlite3.connect(map_file)
+    cursor = connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS patch", (str(patch_file),))
+
+    patch_tables = {
+        row[0]
+        for row in cursor.execute("SELECT name FROM patch.sqlite_master WHERE type = 'table'")
+    }
+    if not {"tiles", "deleted_tiles", "info"} <= patch_tables:
+        print(f"File {patch_file} is not a .sqlitedb patch")
+        exit(1)
+
+    deleted_tiles_count = cursor.execute(
+        "DELETE FROM main.tiles WHERE (x, y, z, s) IN (SELECT x, y, z, s FROM patch.deleted_tiles)"
+    ).rowcount
+    # Carry the hashes over only if the map already caches them, so that the next diff
+    # does not have to rehash the replaced tiles.
+    columns = "x, y, z, s, image, hash" if has_tile_hashes(connection) else "x, y, z, s, image"
+    updated_tiles_count = cursor.execute(
+        f"INSERT OR REPLACE INTO main.tiles ({columns}) SELECT {columns} FROM patch.tiles"  # noqa: S608
+    ).rowcount
+    cursor.execute("DELETE FROM main.info")
+    cursor.execute(
+        "INSERT INTO main.info (maxzoom, minzoom) SELECT maxzoom, minzoom FROM patch.info"
+    )
+    connection.commit()
+    connection.close()
+
+    print(f"Added or changed tiles: {updated_tiles_count}")
+    print(f"Deleted tiles: {deleted_tiles_count}")
+
+
+if __name__ == "__main__":
+    apply_sqlitedb_patch()
@@ -1,9 +1,29 @@
+from __future__ import annotations
+
 import click
 from click_help_colors import HelpColorsGroup
 
 
+class LazyHelpColorsGroup(HelpColorsGroup):
+    """Group which imports a subcommand module only when the subcommand is requested."""
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        from . import __all__ as command_names
+
+        lazy_commands = {name.replace("_", "-") for name in command_names}
+        return sorted({*super().list_commands(ctx), *lazy_commands})
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.commands:
+            import sqlitedb_map_tools
+
+            # Importing the command module registers the command in this group.
+            getattr(sqlitedb_map_tools, cmd_name.replace("-", "_"), None)
+        return super().get_command(ctx, cmd_name)
+
+
 @click.group(
-    cls=HelpColorsGroup,
+    cls=LazyHelpColorsGroup,
     help_headers_color="bright_green",
     help_options_color="bright_yellow",
 )
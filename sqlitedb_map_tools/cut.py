@@ -1,11 +1,13 @@
 import sqlite3
+import tempfile
 import time
 from pathlib import Path
 
 import click
 
 from .cli import cli
-from .utils import _remove_file, coordinates_to_tile_position
+from .shards import ShardTask, copy_tiles_sharded
+from .utils import _remove_file, coordinates_to_tile_position, count_tiles
 
 
 @cli.command(
@@ -37,16 +39,26 @@ from .utils import _remove_file, coordinates_to_tile_position
 @click.option(
     "-f",
     "--force",
+    "replace_file",
     is_flag=True,
     default=False,
     help="Override the output file if it exists.",
 )
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes. With more than one, zoom levels and x ranges of large "
+    "zoom levels are cut into temporary shards in parallel and then stitched. By default 1.",
+)
 def cut_sqlitedb_map(
     input_file: Path,
     output_file: Path,
     upper_left_coordinates: tuple[float, float],
     bottom_right_coordinates: tuple[float, float],
     replace_file: bool,
+    workers: int = 1,
 ) -> None:
     latitude1, longitude1 = upper_left_coordinates
     latitude2, longitude2 = bottom_right_coordinates
@@ -69,30 +81,49 @@ def cut_sqlitedb_map(
     destination_cursor.execute("CREATE TABLE info (maxzoom INT, minzoom INT)")
 
     min_zoom, max_zoom = source_cursor.execute("SELECT minzoom, maxzoom FROM info").fetchone()
-    total_tiles_count = 0
-    start_time = time.perf_counter()
+    zoom_to_x_y_ranges: dict[int, tuple[int, int, int, int]] = {}
     for zoom in range(min_zoom, max_zoom + 1):
         min_x_tile, min_y_tile = coordinates_to_tile_position(latitude1, longitude1, zoom)
         max_x_tile, max_y_tile = coordinates_to_tile_position(latitude2, longitude2, zoom)
+        zoom_to_x_y_ranges[zoom] = (min_x_tile, max_x_tile, min_y_tile, max_y_tile)
 
-        input_data = source_cursor.execute(
-            "SELECT x, y, z, image "
-            "FROM tiles "
-            "WHERE z = ? AND ? <= x AND x <= ? AND ? <= y AND y <= ?",
-            (17 - zoom, min_x_tile, max_x_tile, min_y_tile, max_y_tile),
-        )
-        tiles_count = 0
-        for row in input_data:
-            x_tile, y_tile, zoom, image = row
-            destination_cursor.execute(
-                "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
-                (x_tile, y_tile, zoom, 0, sqlite3.Binary(image)),
+    total_tiles_count = 0
+    start_time = time.perf_counter()
+    if workers > 1:
+        # Weights are tiles counts of the section, which are exact for a fully covered map.
+        task_weights: list[tuple[ShardTask, int]] = [
+            ((17 - zoom, *x_y_ranges), count_tiles(*x_y_ranges))
+            for zoom, x_y_ranges in zoom_to_x_y_ranges.items()
+        ]
+        with tempfile.TemporaryDirectory(dir=output_file.parent) as shards_dir:
+            total_tiles_count = copy_tiles_sharded(
+                destination=destination,
+                source_paths=[input_file],
+                task_weights=task_weights,
+                workers=workers,
+                shards_dir=Path(shards_dir),
+            )
+        print(f"Cut with {workers} workers ({time.perf_counter() - start_time:.3f} s)")
+    else:
+        for zoom, (min_x_tile, max_x_tile, min_y_tile, max_y_tile) in zoom_to_x_y_ranges.items():
+            input_data = source_cursor.execute(
+                "SELECT x, y, z, image "
+                "FROM tiles "
+                "WHERE z = ? AND ? <= x AND x <= ? AND ? <= y AND y <= ?",
+                (17 - zoom, min_x_tile, max_x_tile, min_y_tile, max_y_tile),
             )
-            tiles_count += 1
-        total_tiles_count += tiles_count
-        current_time = time.perf_counter()
-        print(f"Zoom {zoom}: {tiles_count} tiles ({current_time - start_time:.3f} s)")
-        start_time = current_time
+            tiles_count = 0
+            for row in input_data:
+                x_tile, y_tile, z, image = row
+                destination_cursor.execute(
+                    "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
+                    (x_tile, y_tile, z, 0, sqlite3.Binary(image)),
+                )
+                tiles_count += 1
+            total_tiles_count += tiles_count
+            current_time = time.perf_counter()
+            print(f"Zoom {zoom}: {tiles_count} tiles ({current_time - start_time:.3f} s)")
+            start_time = current_time
     destination_cursor.execute(
         "INSERT INTO info (maxzoom, minzoom) VALUES(?, ?)", (max_zoom, min_zoom)
     )
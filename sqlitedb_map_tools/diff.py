@@ -0,0 +1,100 @@
+import sqlite3
+from pathlib import Path
+
+import click
+
+from .cli import cli
+from .utils import _remove_file, ensure_tile_hashes
+
+
+@cli.command(
+    help="Compares two .sqlitedb map files tile by tile and writes a patch file "
+    "with added, changed and deleted tiles.\n\n"
+    "Tiles are compared by content hash, which is cached in a `hash` column "
+    "of both input files, so repeated diffs only hash new tiles. "
+    "Note that this modifies the input files: the column and a trigger clearing "
+    "the hash of updated tiles are added to them.\n\n"
+    "Apply the patch with `sqlitedb-apply`."
+)
+@click.argument(
+    "old_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.argument(
+    "new_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.argument("patch_file", type=click.Path(dir_okay=False, path_type=Path))
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Override the output file if it exists.",
+)
+def diff_sqlitedb_maps(
+    old_file: Path, new_file: Path, patch_file: Path, force: bool = False
+) -> None:
+    _remove_file(patch_file, "Output file %s already exists. Add -f option for overwrite", force)
+
+    connection = sqlite3.connect(old_file)
+    cursor = connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS new", (str(new_file),))
+    cursor.execute("ATTACH DATABASE ? AS patch", (str(patch_file),))
+
+    hashed_tiles_count = ensure_tile_hashes(connection, "main")
+    hashed_tiles_count += ensure_tile_hashes(connection, "new")
+    connection.commit()
+    print(f"Hashed tiles: {hashed_tiles_count} (cached in {old_file} and {new_file})")
+
+    # The patch is a regular .sqlitedb map with the added and changed tiles, so it can be
+    # previewed as is. Deleted tiles are listed in a separate table.
+    cursor.execute(
+        "CREATE TABLE patch.tiles (x INT, y INT, z INT, s INT, image BLOB, hash BLOB, "
+        "PRIMARY KEY (x, y, z, s))"
+    )
+    cursor.execute("CREATE TABLE patch.info (maxzoom INT, minzoom INT)")
+    cursor.execute(
+        "CREATE TABLE patch.deleted_tiles (x INT, y INT, z INT, s INT, PRIMARY KEY (x, y, z, s))"
+    )
+
+    added_tiles_count = cursor.execute(
+        "INSERT INTO patch.tiles (x, y, z, s, image, hash) "
+        "SELECT n.x, n.y, n.z, n.s, n.image, n.hash "
+        "FROM new.tiles AS n "
+        "WHERE NOT EXISTS ("
+        "SELECT 1 FROM main.tiles AS o WHERE o.x = n.x AND o.y = n.y AND o.z = n.z AND o.s = n.s"
+        ")"
+    ).rowcount
+    changed_tiles_count = cursor.execute(
+        "INSERT INTO patch.tiles (x, y, z, s, image, hash) "
+        "SELECT n.x, n.y, n.z, n.s, n.image, n.hash "
+        "FROM new.tiles AS n "
+        "JOIN main.tiles AS o ON o.x = n.x AND o.y = n.y AND o.z = n.z AND o.s = n.s "
+        "WHERE o.hash != n.hash"
+    ).rowcount
+    deleted_tiles_count = cursor.execute(
+        "INSERT INTO patch.deleted_tiles (x, y, z, s) "
+        "SELECT o.x, o.y, o.z, o.s "
+        "FROM main.tiles AS o "
+        "WHERE NOT EXISTS ("
+        "SELECT 1 FROM new.tiles AS n WHERE n.x = o.x AND n.y = o.y AND n.z = o.z AND n.s = o.s"
+        ")"
+    ).rowcount
+    cursor.execute(
+        "INSERT INTO patch.info (maxzoom, minzoom) SELECT maxzoom, minzoom FROM new.info"
+    )
+    connection.commit()
+    connection.close()
+
+    print(f"Added tiles: {added_tiles_count}")
+    print(f"Changed tiles: {changed_tiles_count}")
+    print(f"Deleted tiles: {deleted_tiles_count}")
+    print(
+        f"Patch size: {patch_file.stat().st_size / 1024 ** 2:.2f} MB "
+        f"(new file is {new_file.stat().st_size / 1024 ** 2:.2f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    diff_sqlitedb_maps()
@@ -3,12 +3,13 @@ import sqlite3
 from pathlib import Path
 
 import click
-from PIL import Image
-from tqdm import tqdm
 
 from .cli import cli
+from .tile_codecs import TileRecompressor, codec_options
 from .utils import _remove_file, to_jpg
 
+BATCH_SIZE = 1024
+
 
 @cli.command(help="Converts .mbtiles format to .sqlitedb format suitable for OsmAnd and Locus.")
 @click.argument(
@@ -33,12 +34,23 @@ from .utils import _remove_file, to_jpg
 @click.option(
     "-j", "--jpeg-quality", type=int, help="Convert tiles to JPEG with the specified quality."
 )
+@codec_options()
 def convert_mbtiles_to_sqlitedb(
     mbtiles_path: Path,
     sqlitedb_path: Path | None,
     replace_file: bool = False,
     jpeg_quality: int | None = None,
+    codecs: tuple[str, ...] = (),
+    codec_quality: int = 85,
+    min_psnr: float = 35.0,
+    subsampling: str = "4:2:0",
 ) -> None:
+    from PIL import Image
+    from tqdm import tqdm
+
+    if jpeg_quality is not None and codecs:
+        print("Use either -j or --codec option")
+        exit(1)
     if sqlitedb_path is None:
         sqlitedb_path = Path(f"{mbtiles_path.stem}.sqlitedb")
     _remove_file(
@@ -60,18 +72,33 @@ def convert_mbtiles_to_sqlitedb(
         "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"
     )
 
-    for row in tqdm(iterable=input_data, desc=mbtiles_path.stem):
-        image_bytes = row[3]
-        if jpeg_quality is not None:
-            image = Image.open(io.BytesIO(image_bytes))
-            image_bytes = to_jpg(image, quality=jpeg_quality)
-        zoom, x_tile, y_tile = row[:3]
-        y = (1 << zoom) - 1 - y_tile  # 2 ** zoom - 1 - y_tile
-        z = 17 - zoom
-        destination_cursor.execute(
-            "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
-            (x_tile, y, z, 0, sqlite3.Binary(image_bytes)),
+    recompressor = (
+        TileRecompressor(
+            codecs=codecs, quality=codec_quality, min_psnr=min_psnr, subsampling=subsampling
         )
+        if codecs
+        else None
+    )
+    progress_bar = tqdm(desc=mbtiles_path.stem)
+    try:
+        while rows := input_data.fetchmany(BATCH_SIZE):
+            images = [row[3] for row in rows]
+            if recompressor is not None:
+                images = recompressor.recompress(images)
+            elif jpeg_quality is not None:
+                images = [to_jpg(Image.open(io.BytesIO(i)), quality=jpeg_quality) for i in images]
+            for (zoom, x_tile, y_tile, _), image_bytes in zip(rows, images, strict=True):
+                y = (1 << zoom) - 1 - y_tile  # 2 ** zoom - 1 - y_tile
+                z = 17 - zoom
+                destination_cursor.execute(
+                    "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
+                    (x_tile, y, z, 0, sqlite3.Binary(image_bytes)),
+                )
+            progress_bar.update(len(rows))
+    finally:
+        progress_bar.close()
+        if recompressor is not None:
+            recompressor.close()
 
     destination_cursor.execute(
         "INSERT INTO info (maxzoom, minzoom) SELECT MAX(z), MIN(z) FROM tiles"
@@ -1,9 +1,11 @@
 import sqlite3
+import tempfile
 from pathlib import Path
 
 import click
 
 from .cli import cli
+from .shards import MAX_TILE_POSITION, MIN_TILE_POSITION, ShardTask, copy_tiles_sharded
 from .utils import _remove_file
 
 
@@ -26,8 +28,16 @@ from .utils import _remove_file
     default=False,
     help="Override the output file if it exists.",
 )
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes. With more than one, zoom levels and x ranges of large "
+    "zoom levels are merged into temporary shards in parallel and then stitched. By default 1.",
+)
 def merge_sqlitedb_maps(
-    input_map_paths: list[Path], output_file: Path, force: bool = False
+    input_map_paths: list[Path], output_file: Path, force: bool = False, workers: int = 1
 ) -> None:
     _remove_file(output_file, "Output file %s already exists. Add -f option for overwrite", force)
 
@@ -39,19 +49,46 @@ def merge_sqlitedb_maps(
     )
     destination_cursor.execute("CREATE TABLE info (maxzoom INT, minzoom INT)")
 
-    for source_path in input_map_paths:
-        with sqlite3.connect(source_path) as source:
-            source_cursor = source.cursor()
-            for row in source_cursor.execute("SELECT x, y, z image FROM tiles"):
-                x, y, z, image = row
-                destination_cursor.execute(
-                    "SELECT COUNT(*) FROM tiles WHERE x = ? AND y = ? AND z = ?", (x, y, z)
-                )
-                if destination_cursor.fetchone()[0] == 0:
+    if workers > 1:
+        # Stored zoom -> min x, max x and tiles count over all input files.
+        zoom_stats: dict[int, tuple[int, int, int]] = {}
+        for source_path in input_map_paths:
+            with sqlite3.connect(source_path) as source:
+                for z, min_x, max_x, tiles_count in source.execute(
+                    "SELECT z, MIN(x), MAX(x), COUNT(*) FROM tiles GROUP BY z"
+                ):
+                    if z in zoom_stats:
+                        known_min_x, known_max_x, known_tiles_count = zoom_stats[z]
+                        min_x = min(min_x, known_min_x)
+                        max_x = max(max_x, known_max_x)
+                        tiles_count += known_tiles_count
+                    zoom_stats[z] = (min_x, max_x, tiles_count)
+        task_weights: list[tuple[ShardTask, int]] = [
+            ((z, min_x, max_x, MIN_TILE_POSITION, MAX_TILE_POSITION), tiles_count)
+            for z, (min_x, max_x, tiles_count) in zoom_stats.items()
+        ]
+        with tempfile.TemporaryDirectory(dir=output_file.parent) as shards_dir:
+            copy_tiles_sharded(
+                destination=destination,
+                source_paths=input_map_paths,
+                task_weights=task_weights,
+                workers=workers,
+                shards_dir=Path(shards_dir),
+            )
+    else:
+        for source_path in input_map_paths:
+            with sqlite3.connect(source_path) as source:
+                source_cursor = source.cursor()
+                for row in source_cursor.execute("SELECT x, y, z, image FROM tiles"):
+                    x, y, z, image = row
                     destination_cursor.execute(
-                        "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
-                        (x, y, z, 0, sqlite3.Binary(image)),
+                        "SELECT COUNT(*) FROM tiles WHERE x = ? AND y = ? AND z = ?", (x, y, z)
                     )
+                    if destination_cursor.fetchone()[0] == 0:
+                        destination_cursor.execute(
+                            "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
+                            (x, y, z, 0, sqlite3.Binary(image)),
+                        )
 
     destination_cursor.execute(
         "INSERT INTO info (maxzoom, minzoom) SELECT MAX(z), MIN(z) FROM tiles"
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import statistics
+import time
+from typing import TYPE_CHECKING, Final
+
+from .const import DEFAULT_HEADERS
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+logger: Final[logging.Logger] = logging.getLogger(name=__name__)
+
+# Consecutive failed requests after which a host is ejected.
+MAX_CONSECUTIVE_FAILURES = 3
+# A host is ejected if its latency is this many times above the median latency of others.
+SLOW_HOST_FACTOR = 3.0
+# Successful requests needed before the latency of a host is compared with others.
+MIN_LATENCY_SAMPLES = 20
+# Weight of the latest request in the moving average of host latency.
+LATENCY_SMOOTHING = 0.1
+# Ejection time doubles with every ejection in a row, up to the maximum.
+BASE_EJECTION_SECONDS = 5.0
+MAX_EJECTION_SECONDS = 300.0
+
+
+def expand_url_masks(url_masks: Sequence[str], subdomains: Sequence[str]) -> list[str]:
+    """Substitute `{s}` in url masks with every subdomain, keeping the order of masks.
+
+    Raises ValueError if a url mask has `{s}`, but there are no subdomains.
+    """
+    expanded_url_masks: list[str] = []
+    for url_mask in url_masks:
+        if "{s}" in url_mask:
+            if not subdomains:
+                raise ValueError(f"Url mask {url_mask} has {{s}}, but no subdomains are given")
+            expanded = [url_mask.replace("{s}", subdomain) for subdomain in subdomains]
+        else:
+            expanded = [url_mask]
+        expanded_url_masks.extend(i for i in expanded if i not in expanded_url_masks)
+    return expanded_url_masks
+
+
+class TileHost:
+    """Mirror of a tile server with its own connection pool and request rate budget."""
+
+    def __init__(
+        self,
+        url_mask: str,
+        timeout: int,
+        max_connections: int,
+        max_requests_per_second: int | None = None,
+    ) -> None:
+        import aiohttp
+
+        self.url_mask = url_mask
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(timeout),
+            connector=aiohttp.TCPConnector(limit=max_connections),
+            headers=DEFAULT_HEADERS,
+        )
+        self.in_flight = 0
+        self.latency: float | None = None
+        self.successes_count = 0
+        self.consecutive_failures = 0
+        self.ejections_in_row = 0
+        self.ejected_until = 0.0
+        self._request_interval = 1 / max_requests_per_second if max_requests_per_second else 0.0
+        self._next_request_time = 0.0
+
+    def tile_url(self, x: int, y: int, z: int) -> str:
+        return self.url_mask.format(x=x, y=y, z=z)
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    async def wait_for_readmission(self) -> None:
+        """Sleep until the host is readmitted if it is ejected."""
+        delay = self.ejected_until - time.monotonic()
+        if delay > 0:
+            logger.debug("Waiting %.1f s for readmission of %s", delay, self.url_mask)
+            await asyncio.sleep(delay)
+
+    async def wait_for_turn(self) -> None:
+        """Sleep until the next request fits in the requests per second budget."""
+        if not self._request_interval:
+            return
+        now = time.monotonic()
+        request_time = max(now, self._next_request_time)
+        self._next_request_time = request_time + self._request_interval
+        if request_time > now:
+            await asyncio.sleep(request_time - now)
+
+    def eject(self) -> None:
+        now = time.monotonic()
+        if not self.is_available(now):
+            # Requests sent before the ejection are still finishing.
+            return
+        self.ejections_in_row += 1
+        ejection_seconds = min(
+            BASE_EJECTION_SECONDS * 2 ** (self.ejections_in_row - 1), MAX_EJECTION_SECONDS
+        )
+        self.ejected_until = now + ejection_seconds
+        self.consecutive_failures = 0
+        # The latency is measured again after readmission.
+        self.latency = None
+        self.successes_count = 0
+        logger.info("Ejected %s for %.0f s", self.url_mask, ejection_seconds)
+
+    async def close(self) -> None:
+        if not self.session.closed:
+            await self.session.close()
+
+
+class MirrorPool:
+    """Spreads requests across mirrors, ejecting failing or slow ones for a while."""
+
+    def __init__(
+        self,
+        url_masks: Sequence[str],
+        subdomains: Sequence[str],
+        timeout: int,
+        max_connections_per_host: int,
+        max_requests_per_second: int | None = None,
+    ) -> None:
+        expanded_url_masks = expand_url_masks(url_masks, subdomains)
+        if not expanded_url_masks:
+            raise ValueError("At least one url mask is required")
+        self.hosts = [
+            TileHost(
+                url_mask=url_mask,
+                timeout=timeout,
+                max_connections=max_connections_per_host,
+                max_requests_per_second=max_requests_per_second,
+            )
+            for url_mask in expanded_url_masks
+        ]
+
+    def choose(self) -> TileHost:
+        """Return the available host with the fewest requests in flight.
+
+        If every host is ejected, the one which is readmitted first is returned,
+        the caller has to wait for its readmission.
+        """
+        now = time.monotonic()
+        available_hosts = [host for host in self.hosts if host.is_available(now)]
+        if not available_hosts:
+            return min(self.hosts, key=lambda host: host.ejected_until)
+        return min(
+            available_hosts,
+            key=lambda host: (host.in_flight, host.latency if host.latency is not None else 0.0),
+        )
+
+    async def fetch_tile(self, x: int, y: int, z: int, max_retry_count: int) -> bytes | None:
+        """Download a tile, returning None if the server does not have it."""
+        import aiohttp
+
+        for retry_number in range(max_retry_count + 1):
+            # Every retry picks a host again, so a failing mirror is not retried in a row.
+            host = self.choose()
+            url = host.tile_url(x=x, y=y, z=z)
+            host.in_flight += 1
+            try:
+                # If every mirror is ejected, back off instead of spending the retries at once.
+                await host.wait_for_readmission()
+                await host.wait_for_turn()
+                begin_time = time.perf_counter()
+                async with host.session.get(url) as response:
+                    logger.debug("Sent GET request: %d: %s", response.status, url)
+                    if response.status == 404:
+                        self.report_success(host, time.perf_counter() - begin_time)
+                        return None
+                    if response.status == 200:
+                        image_data = await response.read()
+                        self.report_success(host, time.perf_counter() - begin_time)
+                        return image_data
+                    error = f"status {response.status}"
+            except (asyncio.TimeoutError, aiohttp.ClientError) as exception:
+                error = repr(exception)
+            finally:
+                host.in_flight -= 1
+            self.report_failure(host)
+            logger.debug("Retrying GET request (%d try): %s: %s", retry_number + 1, error, url)
+        raise RuntimeError(f"Too many retries for tile {z}/{x}/{y}")
+
+    def report_success(self, host: TileHost, latency: float) -> None:
+        host.consecutive_failures = 0
+        host.successes_count += 1
+        if host.latency is None:
+            host.latency = latency
+        else:
+            host.latency += LATENCY_SMOOTHING * (latency - host.latency)
+        if host.successes_count >= MIN_LATENCY_SAMPLES:
+            if self._is_slow(host):
+                host.eject()
+            else:
+                host.ejections_in_row = 0
+
+    def report_failure(self, host: TileHost) -> None:
+        host.consecutive_failures += 1
+        if host.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            host.eject()
+
+    def _is_slow(self, host: TileHost) -> bool:
+        now = time.monotonic()
+        other_latencies = [
+            other_host.latency
+            for other_host in self.hosts
+            if other_host is not host
+            and other_host.latency is not None
+            and other_host.is_available(now)
+        ]
+        if not other_latencies or host.latency is None:
+            return False
+        return host.latency > SLOW_HOST_FACTOR * statistics.median(other_latencies)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(host.close() for host in self.hosts))
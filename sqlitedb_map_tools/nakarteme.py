@@ -1,8 +1,6 @@
 from pathlib import Path
 
 import click
-import requests
-from tqdm import tqdm
 
 from .cli import cli
 from .const import TILES_URL
@@ -11,6 +9,9 @@ from .utils import _remove_file
 
 
 def download_file(url: str, file_path: Path, force: bool) -> None:
+    import requests
+    from tqdm import tqdm
+
     file_path.parent.mkdir(parents=True, exist_ok=True)
     _remove_file(
         file_path, "File %s already exists, skipping download. Use `-f` to redownload.", force
@@ -57,6 +58,8 @@ def download_file(url: str, file_path: Path, force: bool) -> None:
 def download_nakarteme_maps(
     maps: list[str], output_dir: Path = Path(), force: bool = False
 ) -> None:
+    import requests
+
     map_names = get_available_map_names()
     available_maps_str = "".join(("Available maps:\n    ", "\n    ".join(map_names)))
     map_names_to_download = maps
@@ -1,7 +1,5 @@
 from html.parser import HTMLParser
 
-import requests
-
 from .const import TILES_URL
 
 
@@ -23,6 +21,8 @@ class NakarteMeHTMLParser(HTMLParser):
 
 
 def get_available_map_names() -> list[str]:
+    import requests
+
     parser = NakarteMeHTMLParser()
     html = requests.get(TILES_URL, timeout=60).text
     parser.feed(html)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import statistics
+import time
+from typing import TYPE_CHECKING, Any
+
+from .tile_codecs import encode_tiles
+from .utils import count_tiles
+
+if TYPE_CHECKING:
+    from .mirrors import MirrorPool
+    from .tile_codecs import TileRecompressor
+
+
+async def _probe_tile(
+    mirrors: MirrorPool, x: int, y: int, z: int, max_retry_count: int
+) -> tuple[float, bytes | None]:
+    begin_time = time.perf_counter()
+    image_data = await mirrors.fetch_tile(x=x, y=y, z=z, max_retry_count=max_retry_count)
+    return time.perf_counter() - begin_time, image_data
+
+
+async def plan_download(
+    mirrors: MirrorPool,
+    zoom_to_x_y_ranges: dict[int, tuple[int, int, int, int]],
+    samples_count: int,
+    max_retry_count: int,
+    max_requests_per_second: int,
+    max_connections_per_host: int,
+    chunk_size: int,
+    recompressor: TileRecompressor | None = None,
+) -> dict[str, Any]:
+    """Estimate the size and duration of a download by probing random tiles of every zoom.
+
+    Tiles are counted exactly, while the share of missing tiles, tile sizes and request
+    latency are extrapolated from `samples_count` tiles per zoom.
+    """
+    hosts_count = len(mirrors.hosts)
+    concurrency = min(chunk_size, hosts_count * max_connections_per_host)
+    total_max_requests_per_second = max_requests_per_second * hosts_count
+
+    zooms: list[dict[str, Any]] = []
+    for zoom, (min_x, max_x, min_y, max_y) in zoom_to_x_y_ranges.items():
+        tiles_count = count_tiles(min_x, max_x, min_y, max_y)
+        column_height = max_y - min_y + 1
+        tile_indexes = random.sample(range(tiles_count), min(samples_count, tiles_count))
+        probes = await asyncio.gather(
+            *(
+                _probe_tile(
+                    mirrors,
+                    x=min_x + tile_index // column_height,
+                    y=min_y + tile_index % column_height,
+                    z=zoom,
+                    max_retry_count=max_retry_count,
+                )
+                for tile_index in tile_indexes
+            )
+        )
+        images = [image_data for _, image_data in probes if image_data is not None]
+        missing_ratio = 1 - len(images) / len(probes)
+        mean_latency = statistics.fmean(latency for latency, _ in probes)
+        mean_tile_size = statistics.fmean(len(i) for i in images) if images else 0.0
+        stored_images = encode_tiles(images, recompressor)
+        mean_stored_size = statistics.fmean(len(i) for i in stored_images) if images else 0.0
+
+        requests_per_second = concurrency / mean_latency if mean_latency else float("inf")
+        if total_max_requests_per_second:
+            requests_per_second = min(requests_per_second, total_max_requests_per_second)
+        existing_tiles_count = tiles_count * (1 - missing_ratio)
+        zooms.append(
+            {
+                "zoom": zoom,
+                "tiles": tiles_count,
+                "sampled_tiles": len(probes),
+                "missing_ratio": round(missing_ratio, 4),
+                "mean_latency_seconds": round(mean_latency, 4),
+                "mean_tile_bytes": round(mean_tile_size),
+                "download_bytes": round(existing_tiles_count * mean_tile_size),
+                "disk_bytes": round(existing_tiles_count * mean_stored_size),
+                "seconds": round(tiles_count / requests_per_second, 1),
+            }
+        )
+
+    return {
+        "hosts": hosts_count,
+        "concurrency": concurrency,
+        "max_requests_per_second": total_max_requests_per_second or None,
+        "zooms": zooms,
+        "total": {
+            key: sum(zoom_plan[key] for zoom_plan in zooms)
+            for key in ("tiles", "download_bytes", "disk_bytes", "seconds")
+        },
+    }
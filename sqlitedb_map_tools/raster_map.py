@@ -1,50 +1,50 @@
 from __future__ import annotations
 
 import asyncio
-import io
+import json
 import logging
 import sqlite3
 import time
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Final
+from typing import TYPE_CHECKING, Final
 
-import aiohttp
 import click
-from PIL import Image
-from tqdm import tqdm
 
 from .cli import cli
-from .const import DEFAULT_HEADERS
-from .utils import _remove_file, async_enumerate, coordinates_to_tile_position, to_jpg
+from .mirrors import MirrorPool, expand_url_masks
+from .planner import plan_download
+from .tile_codecs import TileRecompressor, codec_options, encode_tiles
+from .utils import _remove_file, async_enumerate, coordinates_to_tile_position, count_tiles
 
 if TYPE_CHECKING:
-    from collections.abc import AsyncGenerator
+    from collections.abc import AsyncGenerator, Sequence
     from types import TracebackType
 
-    from PIL.Image import Image as ImageType
-
 logger: Final[logging.Logger] = logging.getLogger(name=__name__)
 
 
 class RasterMapAPI:
     def __init__(
         self,
-        url_mask: str,
+        url_masks: Sequence[str],
         sqlitedb_path: Path,
+        subdomains: Sequence[str] = ("a", "b", "c"),
         timeout: int = 120,
         max_requests_per_second: int | None = None,
+        max_connections_per_host: int = 100,
         max_retry_count: int = 10,
         chunk_size: int = 2048,
+        recompressor: TileRecompressor | None = None,
     ) -> None:
-        self.url_mask = url_mask
         self.max_retry_count = max_retry_count
         self.chunk_size = chunk_size
-        self._session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(timeout),
-            connector=aiohttp.TCPConnector(limit=max_requests_per_second)
-            if max_requests_per_second is not None
-            else None,
-            headers=DEFAULT_HEADERS,
+        self.recompressor = recompressor
+        self.mirrors = MirrorPool(
+            url_masks=url_masks,
+            subdomains=subdomains,
+            timeout=timeout,
+            max_connections_per_host=max_connections_per_host,
+            max_requests_per_second=max_requests_per_second,
         )
         self._create_sqlitedb_file(sqlitedb_path=sqlitedb_path)
 
@@ -56,17 +56,23 @@ class RasterMapAPI:
         min_y: int,
         max_y: int,
     ) -> None:
+        from tqdm import tqdm
+
         x_y_values = [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
         progress_bar = tqdm(total=len(x_y_values), desc=f"Downloading tiles (zoom {zoom})")
         async for chunk_index, tiles_chunk in async_enumerate(
             self._fetch_tiles(zoom, min_x, max_x, min_y, max_y)
         ):
             previous_chinks_tiles_count = chunk_index * self.chunk_size
-            for tile_index, tile in enumerate(tiles_chunk):
-                if tile is not None:
-                    x, y = x_y_values[previous_chinks_tiles_count + tile_index]
-                    self._save_tile(x=x, y=y, z=zoom, image=tile)
-                progress_bar.update()
+            found_tiles = [
+                (x_y_values[previous_chinks_tiles_count + tile_index], tile)
+                for tile_index, tile in enumerate(tiles_chunk)
+                if tile is not None
+            ]
+            images = encode_tiles([tile for _, tile in found_tiles], self.recompressor)
+            for ((x, y), _), image in zip(found_tiles, images, strict=True):
+                self._save_tile(x=x, y=y, z=zoom, image=image)
+            progress_bar.update(len(tiles_chunk))
         self._connection.commit()
 
     def save_min_max_zoom(
@@ -80,27 +86,31 @@ class RasterMapAPI:
 
     async def _fetch_tiles(
         self, zoom: int, min_x: int, max_x: int, min_y: int, max_y: int
-    ) -> AsyncGenerator[list[ImageType | None], None]:
-        fetch_tiles_tasks: list[asyncio.Task[ImageType | None]] = []
+    ) -> AsyncGenerator[list[bytes | None], None]:
+        fetch_tiles_tasks: list[asyncio.Task[bytes | None]] = []
         for x in range(min_x, max_x + 1):
             for y in range(min_y, max_y + 1):
-                tile_url = self.url_mask.format(x=x, y=y, z=zoom)
-                fetch_tiles_tasks.append(asyncio.create_task(self._get_image(url=tile_url)))
+                fetch_tiles_tasks.append(
+                    asyncio.create_task(
+                        self.mirrors.fetch_tile(
+                            x=x, y=y, z=zoom, max_retry_count=self.max_retry_count
+                        )
+                    )
+                )
 
                 if len(fetch_tiles_tasks) >= self.chunk_size:
-                    tiles: list[ImageType | None] = await asyncio.gather(*fetch_tiles_tasks)  # pyright: ignore [reportRedeclaration]
+                    tiles: list[bytes | None] = await asyncio.gather(*fetch_tiles_tasks)  # pyright: ignore [reportRedeclaration]
                     yield tiles
                     fetch_tiles_tasks.clear()
 
         if fetch_tiles_tasks:
-            tiles: list[ImageType | None] = await asyncio.gather(*fetch_tiles_tasks)
+            tiles: list[bytes | None] = await asyncio.gather(*fetch_tiles_tasks)
             yield tiles
 
-    def _save_tile(self, x: int, y: int, z: int, image: ImageType) -> None:
-        image_bytes = to_jpg(image=image)
+    def _save_tile(self, x: int, y: int, z: int, image: bytes) -> None:
         self._cursor.execute(
             "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
-            (x, y, z, 0, sqlite3.Binary(image_bytes)),
+            (x, y, z, 0, sqlite3.Binary(image)),
         )
 
     def _create_sqlitedb_file(self, sqlitedb_path: Path) -> None:
@@ -111,40 +121,8 @@ class RasterMapAPI:
         )
         self._cursor.execute("CREATE TABLE info (maxzoom INT, minzoom INT)")
 
-    async def _get_image(
-        self, url: str = "", retry_number: int = 0, **kwargs: Any
-    ) -> ImageType | None:
-        try:
-            async with self._session.request(method="GET", url=url, **kwargs) as response:
-                logger.debug("Sent GET request: %d: %s", response.status, str(response.url))
-                if response.status == 404:
-                    return None
-                if response.status != 200:
-                    if retry_number == self.max_retry_count:
-                        raise RuntimeError(f"Too many retries for {url}")
-                    logger.debug(
-                        "Retring GET request (%d try): %d: %s",
-                        retry_number + 1,
-                        response.status,
-                        str(response.url),
-                    )
-                    return await self._get_image(url=url, retry_number=retry_number + 1, **kwargs)
-                image_data = await response.read()
-                return Image.open(io.BytesIO(image_data))
-        except asyncio.exceptions.TimeoutError:
-            if retry_number == self.max_retry_count:
-                raise RuntimeError(f"Too many retries for {url!s}")  # noqa: B904
-            logger.debug(
-                "Retring GET request (%d try): %d: %s",
-                retry_number + 1,
-                response.status,  # pyright: ignore [reportPossiblyUnboundVariable]
-                str(response.url),  # pyright: ignore [reportPossiblyUnboundVariable]
-            )
-            return await self._get_image(url=url, retry_number=retry_number + 1, **kwargs)
-
     async def close(self) -> None:
-        if not self._session.closed:
-            await self._session.close()
+        await self.mirrors.close()
         self._connection.close()
 
     async def __aenter__(self) -> RasterMapAPI:
@@ -167,44 +145,90 @@ def _format_seconds(seconds: int | float) -> str:
 
 async def _download_raster_map(
     output_file: Path,
-    url_mask: str,
+    url_masks: Sequence[str],
+    subdomains: Sequence[str],
     replace_file: bool,
     upper_left_coordinates: tuple[float, float],
     bottom_right_coordinates: tuple[float, float],
     min_zoom: int,
     max_zoom: int,
     max_requests_per_second: int,
+    max_connections_per_host: int,
     timeout: int,
     max_retry_count: int,
     chunk_size: int,
+    plan: bool,
+    plan_samples_count: int,
+    recompressor: TileRecompressor | None,
 ) -> None:
+    latitude1, longitude1 = upper_left_coordinates
+    latitude2, longitude2 = bottom_right_coordinates
+    if not (latitude1 > latitude2 and longitude1 < longitude2):
+        print("Enter the coordinates of the upper left and bottom right corners correctly")
+        exit(1)
+    try:
+        expand_url_masks(url_masks, subdomains)
+    except ValueError as exception:
+        print(exception)
+        exit(1)
+
+    zoom_to_x_y_ranges: dict[int, tuple[int, int, int, int]] = {}
+    for zoom in range(min_zoom, max_zoom + 1):
+        min_x, min_y = coordinates_to_tile_position(latitude1, longitude1, zoom)
+        max_x, max_y = coordinates_to_tile_position(latitude2, longitude2, zoom)
+        zoom_to_x_y_ranges[zoom] = (min_x, max_x, min_y, max_y)
+
+    if plan:
+        # Probes are not rate limited, the limit is only taken into account in the estimate.
+        mirrors = MirrorPool(
+            url_masks=url_masks,
+            subdomains=subdomains,
+            timeout=timeout,
+            max_connections_per_host=max_connections_per_host,
+        )
+        try:
+            download_plan = await plan_download(
+                mirrors=mirrors,
+                zoom_to_x_y_ranges=zoom_to_x_y_ranges,
+                samples_count=plan_samples_count,
+                max_retry_count=max_retry_count,
+                max_requests_per_second=max_requests_per_second,
+                max_connections_per_host=max_connections_per_host,
+                chunk_size=chunk_size,
+                recompressor=recompressor,
+            )
+        finally:
+            await mirrors.close()
+        print(json.dumps(download_plan, indent=2))
+        return
+
     _remove_file(
         output_file, "Output file %s already exists. Add -f option for overwrite", replace_file
     )
     async with RasterMapAPI(
-        url_mask=url_mask,
+        url_masks=url_masks,
         sqlitedb_path=output_file,
+        subdomains=subdomains,
         timeout=timeout,
         max_requests_per_second=max_requests_per_second,
+        max_connections_per_host=max_connections_per_host,
         max_retry_count=max_retry_count,
         chunk_size=chunk_size,
+        recompressor=recompressor,
     ) as raster_map_api:
         raster_map_api.save_min_max_zoom(min_zoom=min_zoom, max_zoom=max_zoom)
-
-        latitude1, longitude1 = upper_left_coordinates
-        latitude2, longitude2 = bottom_right_coordinates
+        hosts_count = len(raster_map_api.mirrors.hosts)
+        # The requests per second limit applies to each host separately.
+        total_max_requests_per_second = max_requests_per_second * hosts_count
+        print(f"Hosts: {hosts_count}")
 
         print("Tiles to download:")
-        zoom_to_x_y_ranges: dict[int, tuple[int, int, int, int]] = {}
         total_tiles_count = 0
         total_time_to_save_tiles = 0.0
-        for zoom in range(min_zoom, max_zoom + 1):
-            min_x, min_y = coordinates_to_tile_position(latitude1, longitude1, zoom)
-            max_x, max_y = coordinates_to_tile_position(latitude2, longitude2, zoom)
-            zoom_to_x_y_ranges[zoom] = (min_x, max_x, min_y, max_y)
-            tiles_count = max(max_x - min_x, 1) * max(max_y - min_y, 1)
+        for zoom, (min_x, max_x, min_y, max_y) in zoom_to_x_y_ranges.items():
+            tiles_count = count_tiles(min_x, max_x, min_y, max_y)
             if max_requests_per_second:
-                time_to_save_tiles = tiles_count / max_requests_per_second
+                time_to_save_tiles = tiles_count / total_max_requests_per_second
                 total_time_to_save_tiles += time_to_save_tiles
             print(
                 f"    Zoom {zoom}: {tiles_count} tiles "
@@ -216,7 +240,7 @@ async def _download_raster_map(
         if max_requests_per_second:
             print(
                 f"Minimal time to download tiles: {_format_seconds(total_time_to_save_tiles)} "
-                f"(max RPS is {max_requests_per_second})"
+                f"(max RPS is {total_max_requests_per_second})"
             )
         begin_time = time.perf_counter()
         for zoom, (min_x, max_x, min_y, max_y) in zoom_to_x_y_ranges.items():
@@ -251,11 +275,20 @@ async def _download_raster_map(
 @click.option(
     "-u",
     "--url-mask",
-    "url_mask",
+    "url_masks",
     required=True,
+    multiple=True,
     help="Server url mask from where you want to download tiles. "
-    "It should have `{x}`, `{y}` and `{z}` in it. "
-    "For example, https://tile.openstreetmap.org/{z}/{x}/{y}.png.",
+    "It should have `{x}`, `{y}` and `{z}` in it and may have `{s}` for a subdomain. "
+    "For example, https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png. "
+    "Repeat the option to download from several mirrors.",
+)
+@click.option(
+    "-s",
+    "--subdomains",
+    "subdomains",
+    default="a,b,c",
+    help="Comma-separated subdomains substituted for `{s}` in url masks. By default a,b,c.",
 )
 @click.option(
     "-l",
@@ -295,7 +328,14 @@ async def _download_raster_map(
     "max_requests_per_second",
     type=int,
     default=0,
-    help="Max requests per second limit. By default no limit.",
+    help="Max requests per second limit for each host. By default no limit.",
+)
+@click.option(
+    "--max-connections-per-host",
+    "max_connections_per_host",
+    type=int,
+    default=100,
+    help="Max number of simultaneous connections to each host. By default 100.",
 )
 @click.option(
     "-t",
@@ -321,31 +361,72 @@ async def _download_raster_map(
     help="Size of a chunk with tiles stored in RAM. "
     "After filling a chunk with tiles, they are saved to .sqlitedb output file. By default 2048",
 )
+@click.option(
+    "--plan",
+    "plan",
+    is_flag=True,
+    default=False,
+    help="Print a JSON estimate of tiles count, size and download time for every zoom "
+    "instead of downloading. The output file is not written.",
+)
+@click.option(
+    "--plan-samples",
+    "plan_samples_count",
+    type=click.IntRange(min=1),
+    default=20,
+    help="Number of random tiles per zoom downloaded to estimate tile size and latency "
+    "in `--plan` mode. By default 20.",
+)
+@codec_options()
 def download_raster_map(
     output_file: Path,
-    url_mask: str,
+    url_masks: tuple[str, ...],
+    subdomains: str,
     replace_file: bool,
     upper_left_coordinates: tuple[float, float],
     bottom_right_coordinates: tuple[float, float],
     min_zoom: int,
     max_zoom: int,
     max_requests_per_second: int,
+    max_connections_per_host: int,
     timeout: int,
     max_retry_count: int,
     chunk_size: int,
+    plan: bool,
+    plan_samples_count: int,
+    codecs: tuple[str, ...],
+    codec_quality: int,
+    min_psnr: float,
+    subsampling: str,
 ) -> None:
-    asyncio.run(
-        _download_raster_map(
-            output_file=output_file,
-            url_mask=url_mask,
-            replace_file=replace_file,
-            upper_left_coordinates=upper_left_coordinates,
-            bottom_right_coordinates=bottom_right_coordinates,
-            min_zoom=min_zoom,
-            max_zoom=max_zoom,
-            max_requests_per_second=max_requests_per_second,
-            timeout=timeout,
-            max_retry_count=max_retry_count,
-            chunk_size=chunk_size,
+    recompressor = (
+        TileRecompressor(
+            codecs=codecs, quality=codec_quality, min_psnr=min_psnr, subsampling=subsampling
         )
+        if codecs
+        else None
     )
+    try:
+        asyncio.run(
+            _download_raster_map(
+                output_file=output_file,
+                url_masks=url_masks,
+                subdomains=[i.strip() for i in subdomains.split(",") if i.strip()],
+                replace_file=replace_file,
+                upper_left_coordinates=upper_left_coordinates,
+                bottom_right_coordinates=bottom_right_coordinates,
+                min_zoom=min_zoom,
+                max_zoom=max_zoom,
+                max_requests_per_second=max_requests_per_second,
+                max_connections_per_host=max_connections_per_host,
+                timeout=timeout,
+                max_retry_count=max_retry_count,
+                chunk_size=chunk_size,
+                plan=plan,
+                plan_samples_count=plan_samples_count,
+                recompressor=recompressor,
+            )
+        )
+    finally:
+        if recompressor is not None:
+            recompressor.close()
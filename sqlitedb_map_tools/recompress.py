@@ -0,0 +1,105 @@
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+
+import click
+
+from .cli import cli
+from .tile_codecs import TileRecompressor, codec_options
+from .utils import _remove_file
+
+BATCH_SIZE = 1024
+
+
+@cli.command(
+    help="Recompresses tiles of a .sqlitedb map file to reduce its size.\n\n"
+    "Every tile is encoded with each of the codecs and the smallest result whose quality "
+    "is not below `--min-psnr` is saved. The original tile is kept if it is smaller. "
+    "WebP is not supported by every client, so it is not used by default."
+)
+@click.argument(
+    "input_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.argument("output_file", type=click.Path(dir_okay=False, path_type=Path))
+@codec_options(default_codecs=("jpeg", "png"))
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of worker processes. By default the number of CPUs.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Override the output file if it exists.",
+)
+def recompress_sqlitedb_map(
+    input_file: Path,
+    output_file: Path,
+    codecs: tuple[str, ...],
+    codec_quality: int,
+    min_psnr: float,
+    subsampling: str,
+    workers: int | None,
+    force: bool = False,
+) -> None:
+    _remove_file(output_file, "Output file %s already exists. Add -f option for overwrite", force)
+
+    source = sqlite3.connect(input_file)
+    destination = sqlite3.connect(output_file)
+
+    source_cursor = source.cursor()
+    destination_cursor = destination.cursor()
+
+    destination_cursor.execute(
+        "CREATE TABLE tiles (x INT, y INT, z INT, s INT, image BLOB, PRIMARY KEY (x, y, z, s))"
+    )
+    destination_cursor.execute("CREATE TABLE info (maxzoom INT, minzoom INT)")
+
+    original_sizes: defaultdict[int, int] = defaultdict(int)
+    recompressed_sizes: defaultdict[int, int] = defaultdict(int)
+    input_data = source_cursor.execute("SELECT x, y, z, s, image FROM tiles")
+    with TileRecompressor(
+        codecs=codecs,
+        quality=codec_quality,
+        min_psnr=min_psnr,
+        subsampling=subsampling,
+        workers=workers,
+    ) as recompressor:
+        while rows := input_data.fetchmany(BATCH_SIZE):
+            images = recompressor.recompress([row[4] for row in rows])
+            for (x, y, z, s, original_image), image in zip(rows, images, strict=True):
+                original_sizes[z] += len(original_image)
+                recompressed_sizes[z] += len(image)
+                destination_cursor.execute(
+                    "INSERT INTO tiles (x, y, z, s, image) VALUES (?, ?, ?, ?, ?)",
+                    (x, y, z, s, sqlite3.Binary(image)),
+                )
+            destination.commit()
+
+    min_zoom, max_zoom = source_cursor.execute("SELECT minzoom, maxzoom FROM info").fetchone()
+    destination_cursor.execute(
+        "INSERT INTO info (maxzoom, minzoom) VALUES (?, ?)", (max_zoom, min_zoom)
+    )
+    destination.commit()
+    source.close()
+    destination.close()
+
+    # Zoom in .sqlitedb files is stored as `17 - zoom`.
+    for z in sorted(original_sizes, reverse=True):
+        saved = original_sizes[z] - recompressed_sizes[z]
+        print(
+            f"Zoom {17 - z}: {original_sizes[z] / 1024 ** 2:.2f} MB -> "
+            f"{recompressed_sizes[z] / 1024 ** 2:.2f} MB "
+            f"(saved {saved / max(original_sizes[z], 1):.1%})"
+        )
+    total_saved = sum(original_sizes.values()) - sum(recompressed_sizes.values())
+    print(f"Total saved: {total_saved / 1024 ** 2:.2f} MB")
+
+
+if __name__ == "__main__":
+    recompress_sqlitedb_map()
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+import click
+
+from .cli import cli
+from .utils import tile_hash
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger: Final[logging.Logger] = logging.getLogger(name=__name__)
+
+TileKey = tuple[str, int, int, int]
+# Tile bytes and their ETag, or None if the map has no such tile.
+CachedTile = tuple[bytes, str] | None
+# Tiles of a range read from a map, keyed by `(x, y)`.
+LoadedTiles = dict[tuple[int, int], CachedTile]
+
+# Zoom levels beyond this are not served, so that a request can not make the server
+# build huge tile numbers or pass them to SQLite.
+MAX_ZOOM = 30
+
+# Extra bytes accounted per cache entry, so that cached missing tiles are not free.
+CACHE_ENTRY_OVERHEAD = 64
+
+
+def _guess_content_type(image: bytes) -> str:
+    if image.startswith(b"\x89PNG"):
+        return "image/png"
+    if image.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if image[:4] == b"RIFF" and image[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class TileCache:
+    """LRU cache of tiles limited by the total size of cached images."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._tiles: OrderedDict[TileKey, CachedTile] = OrderedDict()
+
+    def __contains__(self, key: TileKey) -> bool:
+        return key in self._tiles
+
+    def get(self, key: TileKey) -> CachedTile:
+        self._tiles.move_to_end(key)
+        return self._tiles[key]
+
+    def put(self, key: TileKey, tile: CachedTile) -> None:
+        if key in self._tiles:
+            self.size -= self._entry_size(self._tiles.pop(key))
+        entry_size = self._entry_size(tile)
+        if entry_size > self.max_size:
+            return
+        self._tiles[key] = tile
+        self.size += entry_size
+        while self.size > self.max_size:
+            _, evicted_tile = self._tiles.popitem(last=False)
+            self.size -= self._entry_size(evicted_tile)
+
+    @staticmethod
+    def _entry_size(tile: CachedTile) -> int:
+        return CACHE_ENTRY_OVERHEAD + (len(tile[0]) if tile is not None else 0)
+
+
+class TileSource:
+    """Read-only access to a .sqlitedb or .mbtiles file with one connection per thread."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.is_mbtiles = path.suffix.lower() == ".mbtiles"
+        self._local = threading.local()
+
+    def get_tiles(
+        self, zoom: int, min_x: int, max_x: int, min_y: int, max_y: int
+    ) -> dict[tuple[int, int], bytes]:
+        """Return tiles of the XYZ range keyed by `(x, y)`."""
+        if self.is_mbtiles:
+            max_row = (1 << zoom) - 1
+            rows = self._connection().execute(
+                "SELECT tile_column, tile_row, tile_data FROM tiles "
+                "WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? "
+                "AND tile_row BETWEEN ? AND ?",
+                (zoom, min_x, max_x, max_row - max_y, max_row - min_y),
+            )
+            return {(x, max_row - row): image for x, row, image in rows}
+        rows = self._connection().execute(
+            "SELECT x, y, image FROM tiles "
+            "WHERE z = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?",
+            (17 - zoom, min_x, max_x, min_y, max_y),
+        )
+        return {(x, y): image for x, y, image in rows}
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: sqlite3.Connection | None = getattr(self._local, "connection", None)
+        if connection is None:
+            uri = f"{self.path.resolve().as_uri()}?mode=ro"
+            connection = sqlite3.connect(uri, uri=True)
+            self._local.connection = connection
+        return connection
+
+
+class TileServer:
+    def __init__(
+        self,
+        sources: dict[str, TileSource],
+        cache_size: int,
+        workers: int,
+        prefetch: bool,
+    ) -> None:
+        self.sources = sources
+        self.prefetch = prefetch
+        self._cache = TileCache(max_size=cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tiles")
+        # Tile key -> read of a range containing the tile, while the read is in progress.
+        self._pending_loads: dict[TileKey, asyncio.Future[LoadedTiles]] = {}
+
+    def create_app(self) -> web.Application:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/", self._handle_index)
+        app.router.add_get(
+            r"/{name}/{z:\d+}/{x:\d+}/{y:\d+}{extension:(\.\w+)?}", self._handle_tile
+        )
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _handle_index(self, request: web.Request) -> web.Response:
+        from aiohttp import web
+
+        return web.json_response({name: f"/{name}/{{z}}/{{x}}/{{y}}" for name in self.sources})
+
+    async def _handle_tile(self, request: web.Request) -> web.StreamResponse:
+        from aiohttp import web
+
+        name = request.match_info["name"]
+        zoom, x, y = (int(request.match_info[key]) for key in ("z", "x", "y"))
+        if name not in self.sources:
+            raise web.HTTPNotFound(text=f"Unknown map {name}")
+        if zoom > MAX_ZOOM or max(x, y) >= 1 << zoom:
+            raise web.HTTPNotFound()
+
+        tile = await self._get_tile(name, zoom, x, y)
+        if tile is None:
+            raise web.HTTPNotFound()
+        image, etag = tile
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=image, content_type=_guess_content_type(image), headers=headers)
+
+    async def _get_tile(self, name: str, zoom: int, x: int, y: int) -> CachedTile:
+        """Return a tile from the cache, or read it together with its neighbors.
+
+        Requests for tiles which are already being read wait for that read instead of
+        querying the map again, so a cold viewport costs a few range queries.
+        """
+        key = (name, zoom, x, y)
+        if key in self._cache:
+            return self._cache.get(key)
+        load = self._pending_loads.get(key)
+        if load is None:
+            if self.prefetch:
+                max_tile = (1 << zoom) - 1
+                min_x, max_x = max(x - 1, 0), min(x + 1, max_tile)
+                min_y, max_y = max(y - 1, 0), min(y + 1, max_tile)
+            else:
+                min_x, max_x, min_y, max_y = x, x, y, y
+            load = asyncio.ensure_future(self._load_tiles(name, zoom, min_x, max_x, min_y, max_y))
+            range_keys = [
+                (name, zoom, range_x, range_y)
+                for range_x in range(min_x, max_x + 1)
+                for range_y in range(min_y, max_y + 1)
+            ]
+            for range_key in range_keys:
+                self._pending_loads.setdefault(range_key, load)
+            load.add_done_callback(lambda done_load: self._forget_load(done_load, range_keys))
+        # A client closing the connection must not cancel the read for other requests.
+        tiles = await asyncio.shield(load)
+        return tiles[x, y]
+
+    def _forget_load(self, load: asyncio.Future[LoadedTiles], range_keys: list[TileKey]) -> None:
+        for range_key in range_keys:
+            if self._pending_loads.get(range_key) is load:
+                del self._pending_loads[range_key]
+        if not load.cancelled() and load.exception() is not None:
+            logger.error("Failed to read tiles", exc_info=load.exception())
+
+    async def _load_tiles(
+        self, name: str, zoom: int, min_x: int, max_x: int, min_y: int, max_y: int
+    ) -> LoadedTiles:
+        """Read a range of tiles into the cache and return them keyed by `(x, y)`."""
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(
+            self._executor, self.sources[name].get_tiles, zoom, min_x, max_x, min_y, max_y
+        )
+        tiles: LoadedTiles = {}
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                image = images.get((x, y))
+                tile = (image, f'"{tile_hash(image).hex()}"') if image is not None else None
+                self._cache.put((name, zoom, x, y), tile)
+                tiles[x, y] = tile
+        return tiles
+
+    async def _cleanup(self, app: web.Application) -> None:
+        for load in set(self._pending_loads.values()):
+            load.cancel()
+        self._executor.shutdown(wait=True)
+
+
+@cli.command(
+    help="Serves .sqlitedb and .mbtiles map files over HTTP as XYZ tiles.\n\n"
+    "Each map is available at /<file name>/{z}/{x}/{y}, the list of maps is available at /."
+)
+@click.argument(
+    "map_paths",
+    metavar="INPUT_FILES",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.option("-h", "--host", default="127.0.0.1", help="Host to listen on. By default 127.0.0.1.")
+@click.option("-p", "--port", type=int, default=8080, help="Port to listen on. By default 8080.")
+@click.option(
+    "--cache-size",
+    "cache_size_mb",
+    type=int,
+    default=256,
+    help="Size of the in-memory tile cache in megabytes. By default 256.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=4,
+    help="Number of threads reading tiles, each with its own connection. By default 4.",
+)
+@click.option(
+    "--prefetch/--no-prefetch",
+    default=True,
+    help="Read neighboring tiles into the cache along with a requested tile. Enabled by default.",
+)
+def serve_sqlitedb_maps(
+    map_paths: list[Path],
+    host: str,
+    port: int,
+    cache_size_mb: int,
+    workers: int,
+    prefetch: bool,
+) -> None:
+    from aiohttp import web
+
+    sources: dict[str, TileSource] = {}
+    for map_path in map_paths:
+        if map_path.stem in sources:
+            print(f"Several input files are named {map_path.stem}, rename one of them")
+            exit(1)
+        sources[map_path.stem] = TileSource(map_path)
+
+    server = TileServer(
+        sources=sources,
+        cache_size=cache_size_mb * 1024 * 1024,
+        workers=workers,
+        prefetch=prefetch,
+    )
+    for name in sources:
+        print(f"Serving {name} at http://{host}:{port}/{name}/{{z}}/{{x}}/{{y}}")
+    web.run_app(server.create_app(), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    serve_sqlitedb_maps()
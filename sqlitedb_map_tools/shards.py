@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import heapq
+import math
+import sqlite3
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+# Stored zoom (`17 - zoom`), min x, max x, min y, max y of tiles copied to a shard.
+ShardTask = tuple[int, int, int, int, int]
+
+# Bounds of y which select every tile of a column.
+MIN_TILE_POSITION = 0
+MAX_TILE_POSITION = 2**31 - 1
+
+
+def plan_shards(
+    task_weights: Sequence[tuple[ShardTask, int]], shards_count: int
+) -> list[list[ShardTask]]:
+    """Distribute tasks weighted by their tiles count between shards of similar weight.
+
+    A task heavier than a shard, which is usually a high zoom, is split into x ranges first.
+    """
+    target_weight = max(sum(weight for _, weight in task_weights) / shards_count, 1)
+    pieces: list[tuple[int, ShardTask]] = []
+    for (z, min_x, max_x, min_y, max_y), weight in task_weights:
+        pieces_count = min(math.ceil(weight / target_weight), max_x - min_x + 1)
+        if pieces_count <= 1:
+            pieces.append((weight, (z, min_x, max_x, min_y, max_y)))
+            continue
+        columns_count = max_x - min_x + 1
+        next_min_x = min_x
+        for piece_index in range(pieces_count):
+            # Integer bounds, so that rounding never leaves a column out of every piece.
+            piece_min_x = min_x + piece_index * columns_count // pieces_count
+            piece_max_x = min_x + (piece_index + 1) * columns_count // pieces_count - 1
+            if piece_min_x != next_min_x:
+                raise RuntimeError(f"Pieces of zoom {z} do not cover x range {min_x}-{max_x}")
+            next_min_x = piece_max_x + 1
+            pieces.append((weight // pieces_count, (z, piece_min_x, piece_max_x, min_y, max_y)))
+        if next_min_x != max_x + 1:
+            raise RuntimeError(f"Pieces of zoom {z} do not cover x range {min_x}-{max_x}")
+
+    # Longest processing time first: every piece goes to the lightest shard so far.
+    shards: list[list[ShardTask]] = [[] for _ in range(shards_count)]
+    shard_weights = [(0, shard_index) for shard_index in range(shards_count)]
+    for weight, task in sorted(pieces, key=lambda piece: piece[0], reverse=True):
+        shard_weight, shard_index = heapq.heappop(shard_weights)
+        shards[shard_index].append(task)
+        heapq.heappush(shard_weights, (shard_weight + weight, shard_index))
+    return [shard for shard in shards if shard]
+
+
+def build_shard(shard_path: Path, source_paths: Sequence[Path], tasks: Sequence[ShardTask]) -> int:
+    """Copy tiles selected by the tasks from the sources into a new shard database.
+
+    If several sources have the same tile, the one from the first source is kept.
+    Returns the number of tiles in the shard.
+    """
+    connection = sqlite3.connect(shard_path)
+    # The shard is a temporary file, it does not need to survive a crash.
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute(
+        "CREATE TABLE tiles (x INT, y INT, z INT, s INT, image BLOB, PRIMARY KEY (x, y, z, s))"
+    )
+    for source_path in source_paths:
+        connection.execute("ATTACH DATABASE ? AS source", (str(source_path),))
+        for z, min_x, max_x, min_y, max_y in tasks:
+            connection.execute(
+                "INSERT OR IGNORE INTO main.tiles (x, y, z, s, image) "
+                "SELECT x, y, z, 0, image FROM source.tiles "
+                "WHERE z = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?",
+                (z, min_x, max_x, min_y, max_y),
+            )
+        connection.commit()
+        connection.execute("DETACH DATABASE source")
+    (tiles_count,) = connection.execute("SELECT COUNT(*) FROM tiles").fetchone()
+    connection.close()
+    return tiles_count
+
+
+def copy_tiles_sharded(
+    destination: sqlite3.Connection,
+    source_paths: Sequence[Path],
+    task_weights: Sequence[tuple[ShardTask, int]],
+    workers: int,
+    shards_dir: Path,
+) -> int:
+    """Copy tiles into the destination `tiles` table using a shard per worker process.
+
+    Shards are built in parallel in `shards_dir` and then stitched into the destination
+    with bulk inserts. Returns the number of copied tiles.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    shards = plan_shards(task_weights, workers)
+    shard_paths = [shards_dir / f"shard-{i}.sqlitedb" for i in range(len(shards))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(build_shard, shard_path, source_paths, tasks)
+            for shard_path, tasks in zip(shard_paths, shards, strict=True)
+        ]
+        tiles_count = sum(future.result() for future in futures)
+
+    # Shards cover disjoint tile ranges, so their tiles never conflict.
+    for shard_path in shard_paths:
+        destination.execute("ATTACH DATABASE ? AS shard", (str(shard_path),))
+        destination.execute(
+            "INSERT INTO main.tiles (x, y, z, s, image) SELECT x, y, z, s, image FROM shard.tiles"
+        )
+        destination.commit()
+        destination.execute("DETACH DATABASE shard")
+    return tiles_count
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import functools
+import io
+import math
+import os
+import warnings
+from typing import TYPE_CHECKING, TypeVar
+
+import click
+
+from .utils import to_jpg
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+    from types import TracebackType
+
+    from PIL.Image import Image as ImageType
+
+SUBSAMPLINGS = ("4:4:4", "4:2:2", "4:2:0")
+
+F = TypeVar("F", bound="Callable[..., object]")  # Type of a decorated click command
+
+
+def encode_jpeg(image: ImageType, quality: int, subsampling: str) -> bytes | None:
+    if _has_transparency(image):
+        return None
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=UserWarning)
+        image = image.convert("RGB")
+    stream = io.BytesIO()
+    image.save(
+        stream,
+        format="JPEG",
+        quality=quality,
+        subsampling=subsampling,
+        optimize=True,
+        progressive=True,
+    )
+    return stream.getvalue()
+
+
+def encode_palette_png(image: ImageType, quality: int, subsampling: str) -> bytes | None:
+    from PIL import Image
+
+    if _has_transparency(image):
+        image = image.convert("RGBA").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    else:
+        image = image.convert("RGB").quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+    stream = io.BytesIO()
+    image.save(stream, format="PNG", optimize=True)
+    return stream.getvalue()
+
+
+def encode_webp(image: ImageType, quality: int, subsampling: str) -> bytes | None:
+    stream = io.BytesIO()
+    image.save(stream, format="WEBP", quality=quality, method=6)
+    return stream.getvalue()
+
+
+# Codec name -> function encoding an image, or returning None if the codec does not suit it.
+CODECS: dict[str, Callable[[ImageType, int, str], bytes | None]] = {
+    "jpeg": encode_jpeg,
+    "png": encode_palette_png,
+    "webp": encode_webp,
+}
+
+
+def codec_options(default_codecs: Sequence[str] = ()) -> Callable[[F], F]:
+    """Add the options of tile recompression shared by every command which encodes tiles.
+
+    They are passed to the command as `codecs`, `codec_quality`, `min_psnr` and `subsampling`.
+    """
+    codec_help = (
+        "Codec to recompress tiles with, can be repeated. Every tile is saved with the smallest "
+        "encoding meeting `--min-psnr`."
+    )
+    if default_codecs:
+        codec_help += f" By default {' and '.join(default_codecs)}."
+    options = (
+        click.option(
+            "--codec",
+            "codecs",
+            multiple=True,
+            default=tuple(default_codecs),
+            type=click.Choice(list(CODECS)),
+            help=codec_help,
+        ),
+        click.option(
+            "--codec-quality",
+            "codec_quality",
+            type=click.IntRange(1, 100),
+            default=85,
+            help="Quality of JPEG and WebP encoding with `--codec`. By default 85.",
+        ),
+        click.option(
+            "--min-psnr",
+            "min_psnr",
+            type=float,
+            default=35.0,
+            help="Minimal peak signal-to-noise ratio of a tile recompressed with `--codec` "
+            "in dB. By default 35.",
+        ),
+        click.option(
+            "--subsampling",
+            "subsampling",
+            type=click.Choice(SUBSAMPLINGS),
+            default="4:2:0",
+            help="Chroma subsampling of JPEG encoding with `--codec`. By default 4:2:0.",
+        ),
+    )
+
+    def decorator(command: F) -> F:
+        for option in reversed(options):
+            command = option(command)
+        return command
+
+    return decorator
+
+
+def _has_transparency(image: ImageType) -> bool:
+    if image.mode == "P":
+        return "transparency" in image.info
+    if image.mode not in ("RGBA", "LA", "PA"):
+        return False
+    min_alpha, _ = image.getchannel("A").getextrema()
+    return min_alpha < 255  # pyright: ignore [reportOperatorIssue]
+
+
+def psnr(original: ImageType, compressed: ImageType) -> float:
+    """Peak signal-to-noise ratio of a compressed image in decibels."""
+    from PIL import ImageChops, ImageStat
+
+    mode = "RGBA" if _has_transparency(original) else "RGB"
+    difference = ImageChops.difference(original.convert(mode), compressed.convert(mode))
+    rms_values = ImageStat.Stat(difference).rms
+    mse = sum(rms**2 for rms in rms_values) / len(rms_values)
+    if mse == 0:
+        return math.inf
+    return 20 * math.log10(255 / math.sqrt(mse))
+
+
+def recompress_tile(
+    image_bytes: bytes,
+    codecs: Sequence[str],
+    quality: int,
+    min_psnr: float,
+    subsampling: str,
+) -> bytes:
+    """Return the smallest encoding of a tile whose quality is at least `min_psnr`.
+
+    The original tile is returned if no codec produces a smaller image of enough quality.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    best = image_bytes
+    for codec in codecs:
+        encoded = CODECS[codec](image, quality, subsampling)
+        if encoded is None or len(encoded) >= len(best):
+            continue
+        if psnr(image, Image.open(io.BytesIO(encoded))) >= min_psnr:
+            best = encoded
+    return best
+
+
+class TileRecompressor:
+    """Recompresses batches of tiles in a process pool."""
+
+    def __init__(
+        self,
+        codecs: Sequence[str],
+        quality: int = 85,
+        min_psnr: float = 35.0,
+        subsampling: str = "4:2:0",
+        workers: int | None = None,
+    ) -> None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._recompress = functools.partial(
+            recompress_tile,
+            codecs=tuple(codecs),
+            quality=quality,
+            min_psnr=min_psnr,
+            subsampling=subsampling,
+        )
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(max_workers=self._workers)
+
+    def recompress(self, images: Sequence[bytes]) -> list[bytes]:
+        chunksize = max(1, len(images) // (self._workers * 4))
+        return list(self._executor.map(self._recompress, images, chunksize=chunksize))
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> TileRecompressor:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+def encode_tiles(images: Sequence[bytes], recompressor: TileRecompressor | None) -> list[bytes]:
+    """Encode downloaded tiles for saving: recompress them or convert them to JPEG."""
+    from PIL import Image
+
+    if recompressor is not None:
+        return recompressor.recompress(images)
+    return [to_jpg(Image.open(io.BytesIO(image))) for image in images]
@@ -1,11 +1,17 @@
+from __future__ import annotations
+
+import hashlib
 import io
 import math
 import warnings
-from collections.abc import AsyncIterable, AsyncIterator
 from pathlib import Path
-from typing import TypeVar
+from typing import TYPE_CHECKING, TypeVar
+
+if TYPE_CHECKING:
+    import sqlite3
+    from collections.abc import AsyncIterable, AsyncIterator
 
-from PIL.Image import Image as ImageType
+    from PIL.Image import Image as ImageType
 
 
 def _remove_file(file_path: Path, message: str, force: bool = False) -> None:
@@ -36,6 +42,11 @@ def coordinates_to_tile_position(
     return x_tile, y_tile
 
 
+def count_tiles(min_x: int, max_x: int, min_y: int, max_y: int) -> int:
+    """Number of tiles in the inclusive ranges of tile positions."""
+    return (max_x - min_x + 1) * (max_y - min_y + 1)
+
+
 T = TypeVar("T")  # Type variable for the items in the async iterable
 
 
@@ -56,3 +67,39 @@ def to_jpg(image: ImageType, quality: int = 100) -> bytes:
     stream = io.BytesIO()
     image.save(stream, format="JPEG", subsampling=0, quality=quality)
     return stream.getvalue()
+
+
+def tile_hash(image: bytes) -> bytes:
+    return hashlib.blake2b(image, digest_size=16).digest()
+
+
+def has_tile_hashes(connection: sqlite3.Connection, schema: str = "main") -> bool:
+    columns = [row[1] for row in connection.execute(f"PRAGMA {schema}.table_info(tiles)")]
+    return "hash" in columns
+
+
+def ensure_tile_hashes(connection: sqlite3.Connection, schema: str = "main") -> int:
+    """Fill the cached `hash` column of a tiles table, adding the column if it is missing.
+
+    A trigger clears the hash whenever another program updates the image without it.
+    A replaced or inserted tile needs no trigger: its hash is NULL unless the writer sets it.
+    Returns the number of tiles whose hash had to be computed.
+    """
+    if not has_tile_hashes(connection, schema):
+        connection.execute(f"ALTER TABLE {schema}.tiles ADD COLUMN hash BLOB")
+    # The trigger is used by every program writing to the map, so it must not call
+    # `tile_hash`, which only exists in this connection.
+    connection.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {schema}.tiles_clear_hash "  # noqa: S608
+        "AFTER UPDATE OF image ON tiles "
+        "WHEN NEW.hash IS OLD.hash AND NEW.image IS NOT OLD.image "
+        "BEGIN "
+        "UPDATE tiles SET hash = NULL "
+        "WHERE x = NEW.x AND y = NEW.y AND z = NEW.z AND s = NEW.s; "
+        "END"
+    )
+    connection.create_function("tile_hash", 1, tile_hash, deterministic=True)
+    cursor = connection.execute(
+        f"UPDATE {schema}.tiles SET hash = tile_hash(image) WHERE hash IS NULL"  # noqa: S608
+    )
+    return cursor.rowcount